@@ -1,11 +1,18 @@
 
 
 import streamlit as st
+import numpy as np
 import pandas as pd
+import polars as pl
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
 import plotly.express as px
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 import os
-import glob
+import shutil
+import time
 from sqlalchemy.engine.url import URL
 from sqlalchemy import create_engine # 1.4.50
 import warnings
@@ -24,6 +31,7 @@ st.title(" GPS Jamming Monitoring Dashboard")
 
 # Redshift Connection Config
 
+@st.cache_resource
 def start_RS_engine_for_pd(
     db_to_query="sas", 
     host="lli-dev-rpc-redshift.cm1ma67sygrk.eu-west-1.redshift.amazonaws.com", 
@@ -44,7 +52,14 @@ def start_RS_engine_for_pd(
         password=password  # Amazon Redshift password
     )
 
-    engine = create_engine(url)
+    # Cached via st.cache_resource, so this pool is shared across reruns
+    engine = create_engine(
+        url,
+        pool_size=4,
+        max_overflow=4,
+        pool_pre_ping=True,
+        pool_recycle=1800
+    )
 
     return engine
 
@@ -55,13 +70,40 @@ engine = start_RS_engine_for_pd(host="lli-dev-rpc-redshift.cm1ma67sygrk.eu-west-
 # Persistent Run Storage
 
 RUN_FOLDER = "runs"
-os.makedirs(RUN_FOLDER, exist_ok=True)
+
+# Runs live in one hive-partitioned Parquet dataset (runs/dataset/run_ts=<ts>/...);
+# its own subdirectory keeps legacy run_*.csv / run_*.parquet files in runs/ out
+# of the dataset scan. Only the newest RUN_KEEP runs are kept on disk
+RUN_DATASET = os.path.join(RUN_FOLDER, "dataset")
+os.makedirs(RUN_DATASET, exist_ok=True)
+RUN_PARTITIONING = ds.partitioning(pa.schema([("run_ts", pa.string())]), flavor="hive")
+RUN_KEEP = 10
+
+# Above this many vessels the map switches from points to a binned density layer
+MAP_MAX_POINTS = 20_000
+MAP_BIN_DEG = 0.5
+
+# Prefetched snapshots older than this are discarded and fetched again
+PREFETCH_MAX_AGE = 120
 
 
 # SESSION STATE INIT
 
-if "df_current" not in st.session_state:
-    st.session_state.df_current = None
+if "current_run" not in st.session_state:
+    st.session_state.current_run = None
+
+if "cur_pl" not in st.session_state:
+    st.session_state.cur_pl = None
+
+if "vessel_idx" not in st.session_state:
+    st.session_state.vessel_idx = {}
+
+if "timestamps" not in st.session_state:
+    st.session_state.timestamps = None
+
+if "prefetch_future" not in st.session_state:
+    st.session_state.prefetch_future = None
+    st.session_state.prefetch_started = None
 
 if "run_loaded" not in st.session_state:
     st.session_state.run_loaded = False
@@ -78,46 +120,275 @@ compare_prev = st.sidebar.toggle("Compare with previous run", value=True)
 last_n_runs = st.sidebar.slider("Number of runs to display in trend", min_value=2, max_value=10, value=5)
 
 if st.session_state.current_run_name:
-    st.sidebar.caption(f"Active run: {st.session_state.current_run_name}")
+    data_as_of = datetime.strptime(st.session_state.current_run_name[len("run_"):], "%Y%m%d_%H%M%S")
+    st.sidebar.caption(f"Active run: {st.session_state.current_run_name} (data as of {data_as_of:%Y-%m-%d %H:%M:%S})")
 
 
 # Helper: Fetch Redshift Snapshot
+# Deliberately uncached: every Fetch must hit Redshift, and the fetched run is
+# reused across reruns through st.session_state rather than st.cache_data
 
 def fetch_redshift_snapshot():
+    # Project only the used columns and keep the latest event per vessel server-side;
+    # "timestamp" is quoted because TIMESTAMP is reserved in Redshift
     query = """
-    SELECT *
-    FROM lli_prc_dev_gsdbincr_staging.tsw_jammed_events_hist
+    SELECT vesselid, latitude, longitude, eez_overall, "timestamp"
+    FROM (
+        SELECT
+            vesselid,
+            start_latitude AS latitude,
+            start_longitude AS longitude,
+            opened_eez AS eez_overall,
+            event_start AS "timestamp",
+            ROW_NUMBER() OVER (PARTITION BY vesselid ORDER BY event_start DESC) AS rn
+        FROM lli_prc_dev_gsdbincr_staging.tsw_jammed_events_hist
+    ) latest
+    WHERE rn = 1
     """
+    # Stream in chunks into Arrow-backed columns to keep peak memory low
     with engine.connect() as conn:
-        return pd.read_sql(query, conn)
+        df = pd.concat(
+            pd.read_sql(query, conn, chunksize=100_000, dtype_backend="pyarrow"),
+            ignore_index=True
+        )
+    df["timestamp"] = pd.to_datetime(df["timestamp"]).astype(pd.ArrowDtype(pa.timestamp("ns")))
+    # Integer-coded group keys; ids get a fixed width so every run partition
+    # shares one physical type
+    df["eez_overall"] = df["eez_overall"].astype("category")
+    df["vesselid"] = df["vesselid"].astype(pd.ArrowDtype(pa.int64()))
+    # Sorted once so the date filter can binary-search instead of masking
+    df = df.sort_values("timestamp", ignore_index=True)
+    return df
 
 
 
 # Helper: Save Run Snapshot
 
-def save_run(df):
-    timestamp_str = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = os.path.join(RUN_FOLDER, f"run_{timestamp_str}.csv")
-    df.to_csv(filename, index=False)
-    return filename
+def list_runs():
+    return sorted(
+        d.split("=", 1)[1] for d in os.listdir(RUN_DATASET)
+        if d.startswith("run_ts=")
+    )
+
+
+def run_dataset():
+    return ds.dataset(RUN_DATASET, format="parquet", partitioning=RUN_PARTITIONING)
+
+
+def save_run(df, queried_at):
+    # Runs are stamped with when the query started, not when they were saved
+    timestamp_str = queried_at.strftime("%Y%m%d_%H%M%S")
+    # Deduplicate at write so row counts can be read straight from parquet metadata
+    table = pa.Table.from_pandas(df.drop_duplicates("vesselid"), preserve_index=False)
+    # The category's dictionary index width depends on the region count, so
+    # store plain strings to keep one physical type across run partitions
+    table = table.set_column(
+        table.schema.get_field_index("eez_overall"),
+        "eez_overall",
+        pc.cast(table["eez_overall"], pa.string())
+    )
+    table = table.append_column("run_ts", pa.array([timestamp_str] * table.num_rows, pa.string()))
+    ds.write_dataset(
+        table,
+        RUN_DATASET,
+        format="parquet",
+        partitioning=RUN_PARTITIONING,
+        basename_template=f"run_{timestamp_str}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+        file_options=ds.ParquetFileFormat().make_write_options(compression="snappy")
+    )
+
+    # Prune everything older than the newest RUN_KEEP runs
+    for old in list_runs()[:-RUN_KEEP]:
+        shutil.rmtree(os.path.join(RUN_DATASET, f"run_ts={old}"), ignore_errors=True)
+
+    return timestamp_str
+
+
+# Helper: Cached Run Loaders
+# Keyed on run ids; partitions are write-once, so filter edits don't re-trigger disk IO.
+# Every cache here is bounded to RUN_KEEP entries since keys change on each fetch
+
+@st.cache_data(max_entries=RUN_KEEP)
+def load_prev_run(run_ts):
+    # Runs are reduced to the latest event per vessel in Redshift and
+    # deduplicated at write, so no per-vessel reduction is needed here
+    return run_dataset().to_table(
+        columns=["vesselid", "eez_overall", "timestamp"],
+        filter=ds.field("run_ts") == run_ts
+    ).to_pandas()
+
+
+@st.cache_data(max_entries=RUN_KEEP)
+def build_persistence(run_ids):
+    # Scan only vesselid + partition key and count runs per vessel inside Arrow
+    table = run_dataset().to_table(
+        columns=["vesselid", "run_ts"],
+        filter=ds.field("run_ts").isin(list(run_ids))
+    )
+    persistence = table.group_by("vesselid").aggregate([("run_ts", "count_distinct")]).to_pandas()
+    return persistence.rename(columns={"run_ts_count_distinct": "appearances"})
+
+
+@st.cache_data(max_entries=RUN_KEEP)
+def build_region_counts(cur_id, prev_id):
+    # One dataset scan aggregates both runs, already in long form for the bar chart
+    run_ids = [cur_id] if prev_id is None else [cur_id, prev_id]
+    table = run_dataset().to_table(
+        columns=["eez_overall", "vesselid", "run_ts"],
+        filter=ds.field("run_ts").isin(run_ids) & ds.field("eez_overall").is_valid()
+    )
+    counts = (
+        table
+        .group_by(["eez_overall", "run_ts"])
+        .aggregate([("vesselid", "count_distinct")])
+        .to_pandas()
+    )
+    # Regions present in only one run get an explicit 0 bar for the other
+    return (
+        pd.DataFrame({
+            "eez_overall": counts["eez_overall"],
+            "variable": np.where(counts["run_ts"] == cur_id, "current_count", "prev_count"),
+            "value": counts["vesselid_count_distinct"]
+        })
+        .pivot(index="eez_overall", columns="variable", values="value")
+        .reindex(columns=["current_count", "prev_count"])
+        .fillna(0)
+        .astype(int)
+        .reset_index()
+        .melt(id_vars="eez_overall", value_vars=["current_count", "prev_count"])
+    )
+
+
+@st.cache_data(max_entries=RUN_KEEP)
+def build_trend(run_ids):
+    # run_ts -> timestamp; row counts come from parquet metadata, no data read
+    run_times = pd.to_datetime(list(run_ids), format="%Y%m%d_%H%M%S")
+    dataset = run_dataset()
+    counts = [dataset.count_rows(filter=ds.field("run_ts") == r) for r in run_ids]
+    return pd.DataFrame({"run_time": run_times, "jammed_vessels": counts}).sort_values("run_time")
+
+
+# Helper: Cached Figures
+# Rebuilt only when their inputs change, so filter edits don't re-serialise them
+
+@st.cache_data(max_entries=RUN_KEEP)
+def build_bar_fig(region_counts):
+    return px.bar(
+        region_counts,
+        x="eez_overall",
+        y="value",
+        color="variable",
+        text="value",
+        barmode="group",
+        color_discrete_map={"current_count":"blue","prev_count":"green"}
+    )
+
+
+@st.cache_data(max_entries=RUN_KEEP)
+def build_trend_fig(trend_df):
+    return px.line(trend_df, x="run_time", y="jammed_vessels", markers=True, title="Jammed Vessels Trend Across Runs")
+
+
+# Map is keyed on the run name rather than hashing every point
+
+@st.cache_data(max_entries=RUN_KEEP)
+def build_map(run_name, _df):
+    if len(_df) <= MAP_MAX_POINTS:
+        # Plotly can't colour by an Arrow/categorical column holding pd.NA,
+        # so plot regions as plain objects with missing ones labelled
+        points = _df[["latitude", "longitude", "vesselid"]].assign(
+            eez_overall=_df["eez_overall"].astype(object).fillna("Unknown")
+        )
+        fig = px.scatter_mapbox(
+            points,
+            lat="latitude",
+            lon="longitude",
+            color="eez_overall",
+            hover_name="vesselid",
+            zoom=1,
+            height=500
+        )
+        fig.update_traces(mode="markers", marker=dict(size=4))
+    else:
+        # Snap points to a lat/lon grid and send one weighted cell per bin
+        lat = _df["latitude"].to_numpy(dtype=float, na_value=np.nan)
+        lon = _df["longitude"].to_numpy(dtype=float, na_value=np.nan)
+        binned = (
+            pd.DataFrame({
+                "latitude": (np.floor(lat / MAP_BIN_DEG) + 0.5) * MAP_BIN_DEG,
+                "longitude": (np.floor(lon / MAP_BIN_DEG) + 0.5) * MAP_BIN_DEG
+            })
+            .dropna()
+            .groupby(["latitude", "longitude"])
+            .size()
+            .reset_index(name="vessels")
+        )
+        fig = px.density_mapbox(
+            binned,
+            lat="latitude",
+            lon="longitude",
+            z="vessels",
+            radius=10,
+            zoom=1,
+            height=500
+        )
+    fig.update_layout(mapbox_style="open-street-map")
+    return fig
+
+
+# Helper: Background Prefetch
+# Runs the Redshift query while the user is interacting, so Fetch returns immediately
+
+@st.cache_resource
+def bg_exec():
+    return ThreadPoolExecutor(max_workers=2)
+
+
+def fetch_timed_snapshot():
+    queried_at = datetime.now()
+    return queried_at, fetch_redshift_snapshot()
+
+
+def prefetch_snapshot():
+    st.session_state.prefetch_future = bg_exec().submit(fetch_timed_snapshot)
+    st.session_state.prefetch_started = time.monotonic()
+
+
+def take_prefetched_snapshot():
+    future = st.session_state.prefetch_future
+    if future is not None and time.monotonic() - st.session_state.prefetch_started < PREFETCH_MAX_AGE:
+        try:
+            with st.spinner("Fetching Redshift…"):
+                return future.result()
+        except Exception:
+            pass  # Retry in the foreground so the error surfaces normally
+    with st.spinner("Fetching Redshift…"):
+        return fetch_timed_snapshot()
 
 
 # Fetch & Save Current Run
 
+if st.session_state.prefetch_future is None:
+    prefetch_snapshot()
+
 if fetch_data:
-    df_current = fetch_redshift_snapshot()
-    # Map Redshift columns
-    df_current = df_current.rename(columns={
-        "event_start": "timestamp",
-        "start_latitude": "latitude",
-        "start_longitude": "longitude",
-        "opened_eez": "eez_overall"
-    })
-    df_current["timestamp"] = pd.to_datetime(df_current["timestamp"])
-
-    filename = save_run(df_current)
-    st.session_state.df_current = df_current
-    st.session_state.current_run_name = os.path.basename(filename)
+    queried_at, df_current = take_prefetched_snapshot()
+    # Start on the snapshot for the next click
+    prefetch_snapshot()
+    age = (datetime.now() - queried_at).total_seconds()
+    st.caption(f"Snapshot queried at {queried_at:%H:%M:%S} ({age:.0f}s ago).")
+
+    run_ts = save_run(df_current, queried_at)
+    # Snapshot is already reduced to the latest event per vessel in Redshift,
+    # so it is stored as the current run and reused on every rerun
+    st.session_state.current_run = df_current
+    st.session_state.cur_pl = pl.from_pandas(df_current)
+    # vesselid -> row position, for O(1) single-vessel lookups
+    st.session_state.vessel_idx = dict(zip(df_current["vesselid"].tolist(), range(len(df_current))))
+    # Sorted numpy timestamps, converted once per run for the date-range binary search
+    st.session_state.timestamps = df_current["timestamp"].to_numpy(dtype="datetime64[ns]", na_value=np.datetime64("NaT"))
+    st.session_state.current_run_name = f"run_{run_ts}"
     st.session_state.run_loaded = True
 
 if not st.session_state.run_loaded:
@@ -127,22 +398,18 @@ if not st.session_state.run_loaded:
 
 # Load Runs & Previous Run Logic
 
-run_files = sorted(glob.glob(os.path.join(RUN_FOLDER, "run_*.csv")))
-current_run = (
-    st.session_state.df_current
-    .sort_values("timestamp")
-    .groupby("vesselid", as_index=False)
-    .tail(1)
-)
+run_ids = list_runs()
+current_run = st.session_state.current_run
+cur_pl = st.session_state.cur_pl
 
-if len(run_files) > 1 and compare_prev:
-    previous_df = pd.read_csv(run_files[-2])
-    previous_run = (
-        previous_df
-        .sort_values("timestamp")
-        .groupby("vesselid", as_index=False)
-        .tail(1)
-    )
+# Compare against the run saved just before this session's run, not the newest
+# on disk, so another session's fetch can't turn the comparison into a self-diff
+cur_id = st.session_state.current_run_name[len("run_"):]
+earlier_runs = [r for r in run_ids if r < cur_id]
+prev_id = earlier_runs[-1] if earlier_runs else None
+
+if prev_id is not None and compare_prev:
+    previous_run = load_prev_run(prev_id)
     first_run = False
 else:
     previous_run = pd.DataFrame(columns=current_run.columns)
@@ -151,25 +418,26 @@ else:
 
 # Core Logic – New / Resolved Events
 
-current_vessels = set(current_run["vesselid"])
-previous_vessels = set(previous_run["vesselid"])
-new_vessels = current_vessels - previous_vessels
+# Plain numpy arrays instead of Python sets; vessel ids are already unique per run
+current_vessels = current_run["vesselid"].to_numpy()
+previous_vessels = previous_run["vesselid"].to_numpy()
+new_vessels = np.setdiff1d(current_vessels, previous_vessels, assume_unique=True)
 
-current_regions = set(current_run["eez_overall"])
-previous_regions = set(previous_run["eez_overall"])
-new_regions = current_regions - previous_regions
-resolved_regions = previous_regions - current_regions
+current_regions = np.asarray(current_run["eez_overall"].dropna().unique(), dtype=object)
+previous_regions = np.asarray(previous_run["eez_overall"].dropna().unique(), dtype=object)
+new_regions = np.setdiff1d(current_regions, previous_regions, assume_unique=True)
+resolved_regions = np.setdiff1d(previous_regions, current_regions, assume_unique=True)
 
 
 # Sidebar: Smart Alerts
 
 st.sidebar.subheader("Smart Alerts")
 if not first_run:
-    if new_regions:
+    if new_regions.size:
         st.sidebar.warning(f"New region detected: {', '.join(new_regions)}")
-    if resolved_regions:
+    if resolved_regions.size:
         st.sidebar.success(f"Region resolved: {', '.join(resolved_regions)}")
-    if previous_vessels and len(current_vessels) > len(previous_vessels):
+    if previous_vessels.size and len(current_vessels) > len(previous_vessels):
         increase_pct = ((len(current_vessels) - len(previous_vessels)) / len(previous_vessels)) * 100
         if increase_pct > 10:
             st.sidebar.error(f"> {int(increase_pct)}% increase in jammed vessels!")
@@ -188,7 +456,7 @@ if st.button("Show New Jammed Vessels"):
     if first_run:
         st.info("This is the first run. All vessels are baseline.")
     else:
-        new_df = current_run[current_run["vesselid"].isin(new_vessels)]
+        new_df = current_run[np.isin(current_vessels, new_vessels)]
         if new_df.empty:
             st.success("No new vessels detected.")
         else:
@@ -196,8 +464,8 @@ if st.button("Show New Jammed Vessels"):
 
 # Button to show active regions
 if st.button("Show Active Regions"):
-    region_counts = current_run.groupby("eez_overall")["vesselid"].nunique().reset_index(name="jammed_vessels")
-    region_counts["status"] = region_counts["eez_overall"].apply(lambda x: "🆕 New" if x in new_regions else "Active")
+    region_counts = current_run.groupby("eez_overall", observed=True)["vesselid"].nunique().reset_index(name="jammed_vessels")
+    region_counts["status"] = np.where(region_counts["eez_overall"].isin(new_regions), "🆕 New", "Active")
     st.dataframe(region_counts, use_container_width=True)
 
 
@@ -208,46 +476,50 @@ vessel_input = st.text_input("Vessel ID")
 region_input = st.text_input("EEZ / Region")
 date_range = st.date_input("Date Range", value=[datetime.now().date(), datetime.now().date()])
 
-filtered = current_run.copy()
+# Polars frames are immutable, so no defensive copy is needed; date and vessel
+# filters narrow a zero-copy row range, and only the region filter scans rows
+lo, hi = 0, cur_pl.height
 
-# Vessel filter
+# Date filter: current_run is sorted by timestamp, so binary-search the bounds
+if date_range and len(date_range) == 2:
+    start = np.datetime64(pd.to_datetime(date_range[0]), "ns")
+    end = np.datetime64(pd.to_datetime(date_range[1]), "ns")
+    timestamps = st.session_state.timestamps
+    lo = int(np.searchsorted(timestamps, start, side="left"))
+    hi = int(np.searchsorted(timestamps, end, side="right"))
+
+# Vessel filter: hash lookup of the vessel's row instead of a column scan
 if vessel_input:
     if vessel_input.isdigit():
-        filtered = filtered[filtered["vesselid"] == int(vessel_input)]
+        idx = st.session_state.vessel_idx.get(int(vessel_input))
+        lo, hi = (idx, idx + 1) if idx is not None and lo <= idx < hi else (0, 0)
     else:
         st.warning("Vessel ID must be numeric")
 
+filtered = cur_pl.slice(lo, max(hi - lo, 0))
+
 # Region filter
 if region_input:
-    filtered = filtered[filtered["eez_overall"].fillna("").str.contains(region_input, case=False)]
+    # Match against the region categories rather than scanning every row
+    categories = current_run["eez_overall"].cat.categories
+    labels = pa.array(categories.to_numpy(dtype=object), type=pa.string())
+    mask = pc.match_substring_regex(labels, region_input, ignore_case=True).to_numpy(zero_copy_only=False)
+    matched = categories[mask].tolist()
+    filtered = filtered.filter(pl.col("eez_overall").cast(pl.Utf8).is_in(matched))
 
-# Date filter
-if date_range and len(date_range) == 2:
-    start = pd.to_datetime(date_range[0])
-    end = pd.to_datetime(date_range[1])
-    filtered = filtered[(filtered["timestamp"] >= start) & (filtered["timestamp"] <= end)]
-
-st.write(f"Events Found: {len(filtered)}")
-st.dataframe(filtered[["vesselid", "eez_overall", "timestamp"]], use_container_width=True)
+st.write(f"Events Found: {filtered.height}")
+st.dataframe(filtered.select(["vesselid", "eez_overall", "timestamp"]).to_pandas(), use_container_width=True)
 
 
 # Jammed Vessels per Region with Previous Run
 
 st.subheader("Jammed Vessels per Region")
-current_counts = current_run.groupby("eez_overall")["vesselid"].nunique().reset_index(name="current_count")
-previous_counts = previous_run.groupby("eez_overall")["vesselid"].nunique().reset_index(name="prev_count")
-merged_counts = pd.merge(current_counts, previous_counts, on="eez_overall", how="outer").fillna(0)
-
-bar_fig = px.bar(
-    merged_counts.melt(id_vars="eez_overall", value_vars=["current_count", "prev_count"]),
-    x="eez_overall",
-    y="value",
-    color="variable",
-    text="value",
-    barmode="group",
-    color_discrete_map={"current_count":"blue","prev_count":"green"}
-)
-st.plotly_chart(bar_fig, use_container_width=True)
+# Same current/previous runs as the KPIs above
+if cur_id in run_ids:
+    bar_fig = build_bar_fig(build_region_counts(cur_id, None if first_run else prev_id))
+    st.plotly_chart(bar_fig, use_container_width=True)
+else:
+    st.info("This run has been pruned from disk. Fetch again to refresh the region comparison.")
 
 
 
@@ -258,29 +530,19 @@ c1, c2 = st.columns(2)
 
 # Detection Stability
 if not first_run:
-    persist_regions = len(current_regions & previous_regions)
-    stability_pct = persist_regions / len(previous_regions) * 100 if previous_regions else 100
+    persist_regions = len(np.intersect1d(current_regions, previous_regions, assume_unique=True))
+    stability_pct = persist_regions / len(previous_regions) * 100 if previous_regions.size else 100
     c1.metric("Detection Stability (%)", f"{stability_pct:.1f}")
 
 # Event Persistence
-all_runs_df = pd.concat([pd.read_csv(f).drop_duplicates("vesselid") for f in run_files[-last_n_runs:]])
-persistence = all_runs_df.groupby("vesselid").size().reset_index(name="appearances")
+persistence = build_persistence(tuple(run_ids[-last_n_runs:]))
 c2.bar_chart(persistence.set_index("vesselid")["appearances"])
 
 
 # Global Map
 
 st.subheader("Global Jamming Overview")
-map_fig = px.scatter_mapbox(
-    current_run,
-    lat="latitude",
-    lon="longitude",
-    color="eez_overall",
-    hover_name="vesselid",
-    zoom=1,
-    height=500
-)
-map_fig.update_layout(mapbox_style="open-street-map")
+map_fig = build_map(st.session_state.current_run_name, current_run)
 st.plotly_chart(map_fig, use_container_width=True)
 
 
@@ -288,24 +550,8 @@ st.plotly_chart(map_fig, use_container_width=True)
 # Multi-Run Trend
 
 st.subheader(f"Trend – Last {last_n_runs} Runs")
-trend_runs = run_files[-min(last_n_runs, len(run_files)):]
-trend_data = []
-for f in trend_runs:
-    run_df = pd.read_csv(f).drop_duplicates("vesselid")
-
-    run_time = datetime.strptime(
-        os.path.basename(f).replace("run_", "").replace(".csv", ""),
-        "%Y%m%d_%H%M%S"
-    )
-
-    trend_data.append({
-        "run_time": run_time,
-        "jammed_vessels": len(run_df)
-    })
-
-
-trend_df = pd.DataFrame(trend_data).sort_values("run_time")
-trend_fig = px.line(trend_df, x="run_time", y="jammed_vessels", markers=True, title="Jammed Vessels Trend Across Runs")
+trend_df = build_trend(tuple(run_ids[-min(last_n_runs, len(run_ids)):]))
+trend_fig = build_trend_fig(trend_df)
 st.plotly_chart(trend_fig, use_container_width=True)
 
 